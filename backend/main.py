@@ -1,16 +1,23 @@
 import os
 import re
-import json
+import gzip
 import asyncio
+import itertools
 import traceback
-from typing import List, Any, Dict, Optional
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Any, AsyncIterator, Dict, NamedTuple, Optional
 
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 import httpx
+import msgspec
+import orjson
+from cachetools import TTLCache
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api._errors import (
     NoTranscriptFound,
@@ -21,22 +28,74 @@ from youtube_transcript_api._errors import (
 from dotenv import load_dotenv
 from pathlib import Path
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
 # --- Configuration ---
 ROOT = Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / ".env")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
-try:
-    import yt_dlp
-except ImportError:
-    yt_dlp = None
+# yt-dlp is heavy (hundreds of extractor modules) and only needed for the
+# caption fallback, so it is imported on first use.
+_yt_dlp_module = None
+
+
+def _get_yt_dlp():
+    """Return the yt_dlp module, or None when it is not installed."""
+    global _yt_dlp_module
+    if _yt_dlp_module is None:
+        try:
+            import yt_dlp
+        except ImportError:
+            _yt_dlp_module = False
+        else:
+            _yt_dlp_module = yt_dlp
+    return _yt_dlp_module or None
 
 OPENAI_RESPONSES_URL = "https://api.openai.com/v1/responses"
 MODEL = "gpt-4o-mini"
 MAX_OUTPUT_TOKENS = 10000
+# Opt-in: gzip request bodies sent to OpenAI (set OPENAI_GZIP_REQUESTS=1).
+OPENAI_GZIP_REQUESTS = os.environ.get("OPENAI_GZIP_REQUESTS", "").lower() in ("1", "true", "yes")
+
+OPENAI_HEADERS = {
+    "Authorization": f"Bearer {OPENAI_API_KEY}",
+    "Content-Type": "application/json",
+}
+
+# --- Shared HTTP client (keep-alive pool reused across requests) ---
+HTTP_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(120.0, connect=5.0),
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30.0),
+)
+
+# Separate pool for user-supplied webpage URLs. Its shared jar accepts no cookies; fetch_webpage_text
+# keeps a per-call jar instead, so cookies set by one user's fetch never reach another user's request.
+WEB_CLIENT = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(20.0, connect=5.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=30.0),
+    cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+)
+
+# --- Bounded thread pools for blocking transcript / yt-dlp work ---
+IO_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="io")
+# yt-dlp extraction is slow and long-tailed; keep it off IO_POOL so it cannot starve short blocking calls.
+YTDLP_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ytdlp")
+YTDLP_TIMEOUT = 45.0
+
+# --- In-process caches (per worker) ---
+META_CACHE = TTLCache(maxsize=4096, ttl=86400)  # video_id
+TRANSCRIPT_CACHE = TTLCache(maxsize=512, ttl=6 * 3600)  # (video_id, languages)
+ANALYSIS_CACHE = TTLCache(maxsize=512, ttl=24 * 3600)  # (video_id, languages, MODEL, PROMPT_VERSION)
+_INFLIGHT: Dict[Any, asyncio.Task] = {}
 
 # --- FastAPI app ---
-app = FastAPI(title="YouTube & Article Summarizer API")
+app = FastAPI(title="YouTube & Article Summarizer API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -47,36 +106,102 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def install_io_pool():
+    asyncio.get_running_loop().set_default_executor(IO_POOL)
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await HTTP_CLIENT.aclose()
+    await WEB_CLIENT.aclose()
+    IO_POOL.shutdown(wait=False)
+    YTDLP_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+
 # --- Request models (Retained ChatRequest) ---
 class AnalyzeRequest(BaseModel):
     url: Optional[str] = None
     text: Optional[str] = None
     source: Optional[str] = None
 
+class AnalyzeBatchRequest(BaseModel):
+    items: List[AnalyzeRequest]
+
 class ChatRequest(BaseModel):
     context: Dict[str, Any] = {}
     history: List[Dict[str, str]]
+    stream: bool = False
+
+
+# --- Cache helper ---
+async def cached_call(cache: TTLCache, key: Any, factory):
+    """Return cache[key]; concurrent misses for the same key share one factory() run."""
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    flight_key = (id(cache), key)
+    task = _INFLIGHT.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(_fill_cache(cache, key, factory))
+        _INFLIGHT[flight_key] = task
+        task.add_done_callback(lambda t: _settle_flight(flight_key, t))
+    # Shielded so one caller disconnecting does not cancel work others are awaiting.
+    return await asyncio.shield(task)
+
+
+def _settle_flight(flight_key: Any, task: asyncio.Task) -> None:
+    _INFLIGHT.pop(flight_key, None)
+    # Mark the exception as retrieved: if every waiter was cancelled, nobody else reads it and
+    # asyncio would log "Task exception was never retrieved".
+    if not task.cancelled():
+        task.exception()
+
+
+async def _fill_cache(cache: TTLCache, key: Any, factory):
+    value = await factory()
+    cache[key] = value
+    return value
 
 
 # --- Utility: extract video id (Keep) ---
+_VID_V_RE = re.compile(r"v=([A-Za-z0-9_-]{11})")
+_VID_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-")
+
+
 def extract_video_id(url: str) -> str:
-    # typical youtube url patterns
-    m = re.search(r"v=([A-Za-z0-9_-]{11})", url)
-    if m:
-        return m.group(1)
-    m2 = re.search(r"youtu\.be/([A-Za-z0-9_-]{11})", url)
-    if m2:
-        return m2.group(1)
+    # typical youtube url patterns; an 11-char slice check covers the common case,
+    # the regexes only run when that slice is not a valid id
+    i = url.find("v=")
+    if i != -1:
+        cand = url[i + 2:i + 13]
+        if len(cand) == 11 and _VID_CHARS.issuperset(cand):
+            return cand
+        m = _VID_V_RE.search(url, i)
+        if m:
+            return m.group(1)
+    i = url.find("youtu.be/")
+    if i != -1:
+        cand = url[i + 9:i + 20]
+        if len(cand) == 11 and _VID_CHARS.issuperset(cand):
+            return cand
     # fallback: maybe user passed id directly
-    if re.fullmatch(r"[A-Za-z0-9_-]{11}", url):
+    if len(url) == 11 and _VID_CHARS.issuperset(url):
         return url
     raise ValueError("Could not extract YouTube video id from URL.")
 
 
 # --- Non-blocking transcript fetch (Keep all helpers) ---
-def _parse_json3_captions(body: str) -> List[dict]:
+class TranscriptSnippet(NamedTuple):
+    text: str
+    start: float
+    duration: float
+
+
+def _parse_json3_captions(body: bytes) -> List[TranscriptSnippet]:
     try:
-        data = json.loads(body)
+        data = orjson.loads(body)
     except Exception:
         return []
 
@@ -89,11 +214,14 @@ def _parse_json3_captions(body: str) -> List[dict]:
             continue
         start = float(ev.get("tStartMs", 0)) / 1000.0
         dur = float(ev.get("dDurationMs", 0)) / 1000.0
-        out.append({"text": text, "start": start, "duration": dur})
+        out.append(TranscriptSnippet(text, start, dur))
     return out
 
 
-def _parse_vtt_captions(body: str) -> List[dict]:
+_VTT_TIMES_RE = re.compile(r"(?P<start>[0-9:.]+)\s+-->\s+(?P<end>[0-9:.]+)")
+
+
+def _parse_vtt_captions(body: str) -> List[TranscriptSnippet]:
     def to_seconds(t: str) -> float:
         parts = t.split(":")
         if len(parts) == 2:
@@ -103,23 +231,33 @@ def _parse_vtt_captions(body: str) -> List[dict]:
             hrs, mins, rest = parts
         return float(hrs) * 3600 + float(mins) * 60 + float(rest.replace(",", "."))
 
+    # Single pass over lines: an empty line ends a cue, the "-->" line opens one,
+    # and every later line until the next empty one belongs to its text.
     entries = []
-    blocks = re.split(r"\r?\n\r?\n", body.strip())
-    for block in blocks:
-        lines = [ln.strip() for ln in block.splitlines() if ln.strip()]
-        if len(lines) < 2:
+    append = entries.append
+    start_s = end_s = None
+    text_lines = []
+    for raw_line in body.splitlines():
+        if not raw_line:
+            if start_s is not None and text_lines:
+                append(TranscriptSnippet(" ".join(text_lines), start_s, max(end_s - start_s, 0.0)))
+            start_s = None
+            text_lines = []
             continue
-
-        times_line = lines[0]
-        m = re.search(r"(?P<start>[0-9:.]+)\s+-->\s+(?P<end>[0-9:.]+)", times_line)
-        if not m:
-            continue
-        start_s = to_seconds(m.group("start"))
-        end_s = to_seconds(m.group("end"))
-        text = " ".join(lines[1:]).strip()
-        if not text:
+        line = raw_line.strip()
+        if not line:
+            # Whitespace-only lines are skipped; only a truly empty line ends a cue.
             continue
-        entries.append({"text": text, "start": start_s, "duration": max(end_s - start_s, 0.0)})
+        if start_s is None:
+            if "-->" in line:
+                m = _VTT_TIMES_RE.search(line)
+                if m:
+                    start_s = to_seconds(m.group("start"))
+                    end_s = to_seconds(m.group("end"))
+        else:
+            text_lines.append(line)
+    if start_s is not None and text_lines:
+        append(TranscriptSnippet(" ".join(text_lines), start_s, max(end_s - start_s, 0.0)))
     return entries
 
 
@@ -129,25 +267,54 @@ def format_timestamp(seconds: float) -> str:
         total = int(seconds)
     except Exception:
         return ""
+    return _format_whole_seconds(total)
+
+
+@lru_cache(maxsize=8192)
+def _format_whole_seconds(total: int) -> str:
+    # Adjacent caption entries often land on the same second, so memoize on the int.
     hrs, rem = divmod(total, 3600)
     mins, secs = divmod(rem, 60)
-    if hrs:
-        return f"{hrs:02d}:{mins:02d}:{secs:02d}"
-    return f"{mins:02d}:{secs:02d}"
+    # str.zfill is measurably cheaper than format-spec f-strings in this per-entry path.
+    mm_ss = str(mins).zfill(2) + ":" + str(secs).zfill(2)
+    return str(hrs).zfill(2) + ":" + mm_ss if hrs else mm_ss
+
+
+def build_transcript_snippet(entries: List[TranscriptSnippet], limit: int) -> str:
+    """Join "[timestamp]text" lines, stopping as soon as `limit` chars are collected."""
+    lines = []
+    append = lines.append
+    fmt = format_timestamp
+    total = 0
+    for e in entries:
+        line = "[" + fmt(e.start) + "]" + e.text
+        append(line)
+        total += len(line) + 1
+        if total >= limit:
+            break
+    return "\n".join(lines)[:limit]
+
+
+_VIETNAMESE_LOWER = "ăâêôơưđáàạảãắằặẳẵấầậẩẫéèẹẻẽóòọỏõốồộổỗớờợởỡúùụủũứừựửữíìịỉĩýỳỵỷỹ"
+# Upper-case forms are included so the sample does not need lower-casing.
+_VIETNAMESE_CHARS = frozenset(_VIETNAMESE_LOWER + _VIETNAMESE_LOWER.upper())
 
 
 def detect_language_hint(text: str) -> str:
     """Detect language hint for Vietnamese."""
     if not text:
         return "english"
-    sample = text[:400].lower()
-    if re.search(r"[ăâêôơưđáàạảãắằặẳẵấầậẩẫéèẹẻẽóòọỏõốồộổỗớờợởỡúùụủũứừựửữíìịỉĩýỳỵỷỹ]", sample):
+    if not _VIETNAMESE_CHARS.isdisjoint(text[:400]):
         return "vietnamese"
     return "english"
 
 
-def fetch_transcript_via_yt_dlp(video_id: str, languages: List[str] | None = None) -> List[dict]:
+_CAPTION_EXT_PRIORITY = {"json3": 0, "srv3": 1, "vtt": 2}
+
+
+def fetch_transcript_via_yt_dlp(video_id: str, languages: List[str] | None = None) -> List[TranscriptSnippet]:
     """Fallback transcript fetch."""
+    yt_dlp = _get_yt_dlp()
     if yt_dlp is None:
         raise NoTranscriptFound("yt-dlp is not installed in the environment.")
 
@@ -165,13 +332,12 @@ def fetch_transcript_via_yt_dlp(video_id: str, languages: List[str] | None = Non
     def pick_track(caption_dict: Dict[str, Any]) -> Optional[dict]:
         if not caption_dict:
             return None
-        for lang in lang_candidates + list(caption_dict.keys()):
+        priority = _CAPTION_EXT_PRIORITY.get
+        # Preferred languages first, then whatever the video offers; stop at the first hit.
+        for lang in itertools.chain(lang_candidates, caption_dict):
             tracks = caption_dict.get(lang)
-            if not tracks:
-                continue
-            ext_priority = {"json3": 0, "srv3": 1, "vtt": 2}
-            sorted_tracks = sorted(tracks, key=lambda t: ext_priority.get(t.get("ext"), 99))
-            return sorted_tracks[0]
+            if tracks:
+                return min(tracks, key=lambda t: priority(t.get("ext"), 99))
         return None
 
     track = pick_track(subtitles) or pick_track(auto_subtitles)
@@ -187,7 +353,7 @@ def fetch_transcript_via_yt_dlp(video_id: str, languages: List[str] | None = Non
 
     ext = (track.get("ext") or "").lower()
     if ext in ("json3", "srv3"):
-        parsed = _parse_json3_captions(resp.text)
+        parsed = _parse_json3_captions(resp.content)
     elif ext == "vtt":
         parsed = _parse_vtt_captions(resp.text)
     else:
@@ -199,7 +365,7 @@ def fetch_transcript_via_yt_dlp(video_id: str, languages: List[str] | None = Non
     return parsed
 
 
-def fetch_transcript_sync(video_id: str, languages: List[str] | None = None):
+def fetch_transcript_sync(video_id: str, languages: List[str] | None = None) -> List[TranscriptSnippet]:
     """Try multiple transcript strategies."""
     api = YouTubeTranscriptApi()
     preferred = languages or ["vi", "en", "en-US", "en-GB"]
@@ -246,22 +412,31 @@ def fetch_transcript_sync(video_id: str, languages: List[str] | None = None):
             pass
 
     raw = transcript_obj.fetch()
-    if hasattr(raw, "to_raw_data"):
-        raw = raw.to_raw_data()
-
-    entries = []
-    for item in raw:
-        if isinstance(item, dict):
-            text = item.get("text", "")
-            start = float(item.get("start", 0))
-            dur = float(item.get("duration", 0))
-        else:
-            text = getattr(item, "text", "")
-            start = float(getattr(item, "start", 0))
-            dur = float(getattr(item, "duration", 0))
-        if not text:
-            continue
-        entries.append({"text": text, "start": start, "duration": dur})
+    if hasattr(raw, "snippets"):
+        # FetchedTranscript (v1.x): snippet fields are already typed, so read them
+        # directly instead of copying through to_raw_data().
+        entries = [TranscriptSnippet(s.text, s.start, s.duration) for s in raw.snippets if s.text]
+    elif isinstance(raw, list) and raw and isinstance(raw[0], dict):
+        # Legacy list-of-dicts shape: detect it once and skip the per-item type checks.
+        entries = [
+            TranscriptSnippet(r["text"], float(r.get("start", 0)), float(r.get("duration", 0)))
+            for r in raw
+            if r.get("text")
+        ]
+    else:
+        entries = []
+        for item in raw:
+            if isinstance(item, dict):
+                text = item.get("text", "")
+                start = float(item.get("start", 0))
+                dur = float(item.get("duration", 0))
+            else:
+                text = getattr(item, "text", "")
+                start = float(getattr(item, "start", 0))
+                dur = float(getattr(item, "duration", 0))
+            if not text:
+                continue
+            entries.append(TranscriptSnippet(text, start, dur))
 
     if not entries:
         raise NoTranscriptFound(f"Empty transcript for video {video_id}")
@@ -269,17 +444,32 @@ def fetch_transcript_sync(video_id: str, languages: List[str] | None = None):
     return entries
 
 async def fetch_transcript(video_id: str, languages: List[str] | None = None):
-    loop = asyncio.get_event_loop()
+    key = (video_id, tuple(languages or ()))
+    return await cached_call(TRANSCRIPT_CACHE, key, lambda: _fetch_transcript(video_id, languages))
+
+
+async def _fetch_transcript_via_yt_dlp(video_id: str, languages: List[str] | None = None):
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(YTDLP_EXECUTOR, fetch_transcript_via_yt_dlp, video_id, languages)
+    try:
+        return await asyncio.wait_for(fut, timeout=YTDLP_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"yt-dlp timed out after {YTDLP_TIMEOUT:.0f}s") from None
+
+
+async def _fetch_transcript(video_id: str, languages: List[str] | None = None):
+    # asyncio.to_thread runs on the loop's default executor, which is IO_POOL (see install_io_pool);
+    # the yt-dlp fallback has its own bounded pool.
     try:
-        return await loop.run_in_executor(None, lambda: fetch_transcript_sync(video_id, languages))
+        return await asyncio.to_thread(fetch_transcript_sync, video_id, languages)
     except TranscriptsDisabled as e:
         try:
-            return await loop.run_in_executor(None, lambda: fetch_transcript_via_yt_dlp(video_id, languages))
+            return await _fetch_transcript_via_yt_dlp(video_id, languages)
         except Exception as yt_e:
             raise RuntimeError(f"TranscriptsDisabled; yt_dlp_fallback: {yt_e}") from yt_e
     except NoTranscriptFound as e:
         try:
-            return await loop.run_in_executor(None, lambda: fetch_transcript_via_yt_dlp(video_id, languages))
+            return await _fetch_transcript_via_yt_dlp(video_id, languages)
         except Exception as yt_e:
             raise RuntimeError(f"NoTranscriptFound: {e}; yt_dlp_fallback: {yt_e}") from yt_e
     except VideoUnavailable as e:
@@ -292,14 +482,17 @@ async def fetch_transcript(video_id: str, languages: List[str] | None = None):
 
 # --- Metadata via YouTube oEmbed (Keep) ---
 async def fetch_video_metadata(video_id: str) -> Dict[str, Any]:
+    return await cached_call(META_CACHE, video_id, lambda: _fetch_video_metadata(video_id))
+
+
+async def _fetch_video_metadata(video_id: str) -> Dict[str, Any]:
     url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
 
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url)
-        if r.status_code != 200:
-            raise RuntimeError(f"MetadataFetchFailed: {r.text}")
+    r = await HTTP_CLIENT.get(url)
+    if r.status_code != 200:
+        raise RuntimeError(f"MetadataFetchFailed: {r.text}")
 
-    data = r.json()
+    data = orjson.loads(r.content)
     return {
         "title": data.get("title"),
         "channel": data.get("author_name"),
@@ -308,51 +501,38 @@ async def fetch_video_metadata(video_id: str) -> Dict[str, Any]:
 
 
 # --- Generic helpers (Keep) ---
+# List-valued schema fields: (key, item template for a bare-string value, field that receives the string)
+_LIST_FIELDS = (
+    ("terminologies", {"term": ""}, "definition"),
+    ("major_points", {"timestamp": "", "title": ""}, "summary"),
+    ("chapters", {"timestamp": "", "title": ""}, "summary"),
+    ("mindmap", None, None),
+    ("flashcards", {"q": "", "a": ""}, "summary"),
+    ("quiz", {"q": "", "choices": [], "answer": ""}, "summary"),
+)
+
+
+_QUIZ_CHOICE_SPLIT_RE = re.compile(r"[\r\n]+|[|;/]")
+_QUIZ_FILLERS = ("None of the above", "All of the above", "Not enough information", "Cannot be determined")
+
+
+def _as_list(value: Any, template: Optional[dict] = None, text_key: Optional[str] = None) -> list:
+    """Coerce a model field into a list of items."""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, dict):
+        return [value]
+    if isinstance(value, str) and template is not None:
+        return [{**template, text_key: value}]
+    return []
+
+
 def normalize_terms_and_points(payload: dict) -> dict:
-    terms = payload.get("terminologies")
-
-    if isinstance(terms, dict):
-        payload["terminologies"] = [terms]
-    elif terms is None:
-        payload["terminologies"] = []
-    elif isinstance(terms, str):
-        payload["terminologies"] = [{"term": "", "definition": terms}]
-    elif not isinstance(terms, list):
-        payload["terminologies"] = []
-
-    mp = payload.get("major_points")
-    if isinstance(mp, dict):
-        payload["major_points"] = [mp]
-    elif mp is None:
-        payload["major_points"] = []
-    elif isinstance(mp, str):
-        payload["major_points"] = [{"timestamp": "", "title": "", "summary": mp}]
-    elif not isinstance(mp, list):
-        payload["major_points"] = []
-
-    chapters = payload.get("chapters")
-    if isinstance(chapters, dict):
-        payload["chapters"] = [chapters]
-    elif chapters is None:
-        payload["chapters"] = []
-    elif isinstance(chapters, str):
-        payload["chapters"] = [{"timestamp": "", "title": "", "summary": chapters}]
-    elif not isinstance(chapters, list):
-        payload["chapters"] = []
-        
-    # Also normalize mindmap, flashcards, quiz data just in case model returns non-array types
-    def safe_normalize_list(key, default_item=None):
-        val = payload.get(key)
-        if isinstance(val, dict):
-            payload[key] = [val]
-        elif isinstance(val, str) and default_item:
-             payload[key] = [{**default_item, 'summary': val}]
-        elif not isinstance(val, list):
-            payload[key] = []
-    
-    safe_normalize_list('mindmap')
-    safe_normalize_list('flashcards', default_item={'q': '', 'a': ''})
-    safe_normalize_list('quiz', default_item={'q': '', 'choices': [], 'answer': ''})
+    # Lists are the common case and are left untouched.
+    for key, template, text_key in _LIST_FIELDS:
+        value = payload.get(key)
+        if not isinstance(value, list):
+            payload[key] = _as_list(value, template, text_key)
 
     # Ensure quiz items are consistent and always have 4 choices.
     quiz = payload.get("quiz")
@@ -367,20 +547,24 @@ def normalize_terms_and_points(payload: dict) -> dict:
             raw_choices = item.get("choices") or item.get("options") or item.get("answers") or []
 
             if isinstance(raw_choices, str):
-                raw_choices = [c.strip() for c in re.split(r"[\r\n]+|[|;/]", raw_choices) if c.strip()]
+                raw_choices = [c.strip() for c in _QUIZ_CHOICE_SPLIT_RE.split(raw_choices) if c.strip()]
             elif not isinstance(raw_choices, list):
                 raw_choices = []
 
+            # Set-backed dedup; `seen` mirrors `cleaned` until the truncation below.
+            seen = set()
             cleaned = []
             for c in raw_choices:
                 if c is None:
                     continue
-                s = str(c).strip()
-                if s and s not in cleaned:
+                s = c.strip() if isinstance(c, str) else str(c).strip()
+                if s and s not in seen:
+                    seen.add(s)
                     cleaned.append(s)
 
-            ans = str(answer).strip() if answer is not None else ""
-            if ans and ans not in cleaned:
+            ans = answer.strip() if isinstance(answer, str) else str(answer).strip()
+            if ans and ans not in seen:
+                seen.add(ans)
                 cleaned.append(ans)
 
             # Keep exactly 4 choices, making sure the answer is included.
@@ -393,11 +577,10 @@ def normalize_terms_and_points(payload: dict) -> dict:
                     cleaned = cleaned[:4]
 
             if len(cleaned) < 4:
-                fillers = ["None of the above", "All of the above", "Not enough information", "Cannot be determined"]
-                for f in fillers:
+                for f in _QUIZ_FILLERS:
                     if len(cleaned) >= 4:
                         break
-                    if f not in cleaned and f != ans:
+                    if f not in seen and f != ans:
                         cleaned.append(f)
                 while len(cleaned) < 4:
                     cleaned.append(f"Option {len(cleaned) + 1}")
@@ -410,88 +593,179 @@ def normalize_terms_and_points(payload: dict) -> dict:
     return payload
 
 
+_SCRIPT_RE = re.compile(r"<script.*?>.*?</script>", re.I | re.S)
+_STYLE_RE = re.compile(r"<style.*?>.*?</style>", re.I | re.S)
+_TAG_RE = re.compile(r"<[^>]+>", re.S)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
 def clean_html_to_text(html: str) -> str:
-    no_script = re.sub(r"(?is)<script.*?>.*?</script>", " ", html)
-    no_style = re.sub(r"(?is)<style.*?>.*?</style>", " ", no_script)
-    text_only = re.sub(r"(?s)<[^>]+>", " ", no_style)
-    text_only = re.sub(r"\s+", " ", text_only)
+    if LexborHTMLParser is None:
+        return _clean_html_to_text_regex(html)
+    # One C-level parse instead of four full-document regex passes.
+    tree = LexborHTMLParser(html)
+    for node in tree.css("script, style, noscript"):
+        node.decompose()
+    root = tree.body or tree.root
+    text = root.text(separator=" ") if root is not None else ""
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _clean_html_to_text_regex(html: str) -> str:
+    no_script = _SCRIPT_RE.sub(" ", html)
+    no_style = _STYLE_RE.sub(" ", no_script)
+    text_only = _TAG_RE.sub(" ", no_style)
+    text_only = _WHITESPACE_RE.sub(" ", text_only)
     return text_only.strip()
 
 
+# Only the first 20k chars of extracted text are summarised; the cap leaves room for
+# the inline scripts/styles many pages carry before their body text.
+MAX_WEBPAGE_BYTES = 1_000_000
+MAX_WEBPAGE_REDIRECTS = 10
+
+
 async def fetch_webpage_text(url: str) -> str:
-    async with httpx.AsyncClient(follow_redirects=True, timeout=20.0) as client:
-        resp = await client.get(url)
+    # Redirects are followed by hand so cookies set along the way (set-cookie-then-redirect pages)
+    # are sent back on later hops from a jar that lives only for this fetch.
+    cookies = httpx.Cookies()
+    request = WEB_CLIENT.build_request("GET", url)
+    for _ in range(MAX_WEBPAGE_REDIRECTS + 1):
+        cookies.set_cookie_header(request)
+        resp = await WEB_CLIENT.send(request, stream=True, follow_redirects=False)
+        cookies.extract_cookies(resp)
+        if resp.next_request is None:
+            break
+        await resp.aclose()
+        request = resp.next_request
+    else:
+        raise httpx.TooManyRedirects(f"Exceeded {MAX_WEBPAGE_REDIRECTS} redirects.", request=request)
+
+    try:
         resp.raise_for_status()
-    return clean_html_to_text(resp.text)
+        body = bytearray()
+        async for chunk in resp.aiter_bytes(65536):
+            body.extend(chunk)
+            if len(body) >= MAX_WEBPAGE_BYTES:
+                break
+        encoding = resp.charset_encoding or "utf-8"
+    finally:
+        await resp.aclose()
+
+    del body[MAX_WEBPAGE_BYTES:]
+    try:
+        html = body.decode(encoding, errors="replace")
+    except LookupError:
+        html = body.decode("utf-8", errors="replace")
+    return clean_html_to_text(html)
+
+
+# --- Prompt templates (built once at import) ---
+# Part of the analysis cache key; bump when prompt wording changes so stale results are not served.
+PROMPT_VERSION = 1
+
+# Restored features (mindmap, flashcards, quiz) to schema
+TEXT_SYSTEM_PROMPT = (
+    "You are an assistant that returns JSON ONLY (no markdown). "
+    "Schema keys must include: title, overview, tags, chapters, major_points, terminologies, mindmap, flashcards, quiz. "
+    "Mindmap must be pure JSON (no prose), rooted in a central theme with 4-6 branches, each branch having a summary and 3-4 children using the {title, summary, children} format. "
+    "Flashcards must be 6-12 items. Quiz must be 5-10 MCQs with 4 choices each. "
+    ""
+    "Core Content requirements (MUST BE FOLLOWED STRICTLY): "
+    "- title: MUST be a new, concise, and engaging title (Summary Title). "
+    "- overview: MUST be 2-3 dense paragraphs summarizing the core message, key findings, or primary conclusion (Core Message). "
+    "- major_points: MUST contain 3-5 high-impact, actionable insights derived from the text (Key Takeaways). "
+    "- chapters: MUST contain 5-8 major sections, using section titles/markers (instead of timestamps) in the 'timestamp' field. Each has a short title and 1-2 sentence summary with concrete facts (Detailed Topic Breakdown). "
+    "- terminologies: MUST contain 3-7 important vocabulary/concepts with concise definitions (Key Terms & Concepts). "
+    "- tags: MUST contain 6-12 short tags (no hashtags), derived from the text. "
+    "Keep the output language consistent with the source text. Return strictly JSON."
+)
+
+TEXT_USER_TEMPLATE = (
+    "SOURCE_TYPE: {source_label}\n"
+    "TITLE_HINT: {title_hint}\n"
+    "CONTENT:\n{content}\n\n"
+    "TASK:\n"
+    "- Produce detailed JSON strictly following the defined schema and content requirements.\n"
+    "- Return strictly JSON with no extra text."
+)
+
+# System Prompt for YouTube: Enforcing all features
+YOUTUBE_SYSTEM_PROMPT = (
+    "You are a careful YouTube transcript analyzer. Return JSON ONLY (no markdown, no extra text). "
+    "Output must be a single valid JSON object that strictly follows this schema keys: "
+    "type, title, channel, overview, tags, chapters, major_points, terminologies, mindmap, flashcards, quiz. "
+    "Mindmap must be pure JSON, rooted in a central theme with 4-6 branches, each branch having a summary and 3-4 children using the {title, summary, children} format. "
+    "Flashcards must be 6-12 items. Quiz must be 5-10 MCQs with 4 choices each. "
+    ""
+    "Core Content requirements (MUST BE FOLLOWED STRICTLY): "
+    "- title: MUST be a new, concise, and engaging title (Summary Title). "
+    "- overview: MUST be 2-3 robust paragraphs (Core Message). "
+    "- major_points: MUST contain 3-5 high-impact, actionable insights (Key Takeaways). "
+    "- chapters: MUST contain 8-14 items, chronological, each with a required timestamp, sharp title, and a 1-2 sentence factual summary (Detailed Topic Breakdown). **The summary text for each chapter MUST explicitly begin with a reference to its timestamp.** "
+    "- terminologies: MUST contain 3-7 important vocabulary or core concepts with concise definitions (Key Terms & Concepts). "
+    "- tags: MUST contain 6-12 short tags (no hashtags), derived from transcript terms. "
+    "Return strictly JSON."
+)
+
+YOUTUBE_USER_TEMPLATE = (
+    "LANGUAGE_HINT: {language_hint}\n"
+    "METADATA:\ntitle: {title}\nchannel: {channel}\n\n"
+    "TRANSCRIPT_SNIPPET:\n{snippet}\n\n"
+    "TASK:\n"
+    "- Classify the video type: educational, song, or other (store in `type`).\n"
+    "- Apply the strict constraints from the SYSTEM PROMPT.\n"
+    "- Respond entirely in Vietnamese when LANGUAGE_HINT is Vietnamese; otherwise respond in English.\n"
+    "- Return strictly JSON."
+)
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "Answer ONLY using the provided context. "
+    "Use timestamps when relevant."
+)
+
+TEXT_SYSTEM_MESSAGE = {"role": "system", "content": TEXT_SYSTEM_PROMPT}
+YOUTUBE_SYSTEM_MESSAGE = {"role": "system", "content": YOUTUBE_SYSTEM_PROMPT}
+CHAT_SYSTEM_MESSAGE = {"role": "system", "content": CHAT_SYSTEM_PROMPT}
 
 
 async def summarize_text_block(text: str, source_label: str = "text", title_hint: Optional[str] = None) -> dict:
-    trimmed = (text or "").strip()
+    # Cut to the 20k window before stripping trailing whitespace so large pastes are
+    # not copied in full; lstrip() returns the same object when there is nothing to strip.
+    trimmed = (text or "").lstrip()[:20000].rstrip()
     if not trimmed:
         raise ValueError("No text provided for summarization.")
 
-    if len(trimmed) > 20000:
-        trimmed = trimmed[:20000]
-    
-    # Restored features (mindmap, flashcards, quiz) to schema
-    system_prompt = (
-        "You are an assistant that returns JSON ONLY (no markdown). "
-        "Schema keys must include: title, overview, tags, chapters, major_points, terminologies, mindmap, flashcards, quiz. "
-        "Mindmap must be pure JSON (no prose), rooted in a central theme with 4-6 branches, each branch having a summary and 3-4 children using the {title, summary, children} format. "
-        "Flashcards must be 6-12 items. Quiz must be 5-10 MCQs with 4 choices each. "
-        ""
-        "Core Content requirements (MUST BE FOLLOWED STRICTLY): "
-        "- title: MUST be a new, concise, and engaging title (Summary Title). "
-        "- overview: MUST be 2-3 dense paragraphs summarizing the core message, key findings, or primary conclusion (Core Message). "
-        "- major_points: MUST contain 3-5 high-impact, actionable insights derived from the text (Key Takeaways). "
-        "- chapters: MUST contain 5-8 major sections, using section titles/markers (instead of timestamps) in the 'timestamp' field. Each has a short title and 1-2 sentence summary with concrete facts (Detailed Topic Breakdown). "
-        "- terminologies: MUST contain 3-7 important vocabulary/concepts with concise definitions (Key Terms & Concepts). "
-        "- tags: MUST contain 6-12 short tags (no hashtags), derived from the text. "
-        "Keep the output language consistent with the source text. Return strictly JSON."
-    )
-
-    user_payload = (
-        f"SOURCE_TYPE: {source_label}\n"
-        f"TITLE_HINT: {title_hint or ''}\n"
-        f"CONTENT:\n{trimmed}\n\n"
-        "TASK:\n"
-        "- Produce detailed JSON strictly following the defined schema and content requirements.\n"
-        "- Return strictly JSON with no extra text."
+    user_payload = TEXT_USER_TEMPLATE.format(
+        source_label=source_label,
+        title_hint=title_hint or "",
+        content=trimmed,
     )
 
     resp = await call_openai(
-        [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_payload}],
+        [TEXT_SYSTEM_MESSAGE, {"role": "user", "content": user_payload}],
         temperature=0.2,
         max_tokens=MAX_OUTPUT_TOKENS,
+        json_only=True,
     )
 
     model_text = extract_text_from_responses_api(resp)
+    if not model_text:
+        raise RuntimeError(f"OpenAI returned no output text (status: {resp.status}).")
 
-    parsed = None
     try:
-        parsed = json.loads(model_text)
+        parsed = orjson.loads(model_text)
     except Exception:
-        m = re.search(r"\{[\s\S]*\}\s*$", model_text)
-        if m:
-            candidate = m.group(0)
-            try:
-                parsed = json.loads(candidate)
-            except Exception:
-                parsed = None
+        parsed = None
 
     if not isinstance(parsed, dict):
         parsed = {"overview": model_text}
 
     parsed.setdefault("title", title_hint or "Text summary")
     parsed.setdefault("channel", "Custom input")
-    parsed.setdefault("type", parsed.get("type", source_label))
-    parsed.setdefault("tags", parsed.get("tags", []))
-    parsed.setdefault("major_points", parsed.get("major_points", []))
-    parsed.setdefault("chapters", parsed.get("chapters", []))
-    parsed.setdefault("terminologies", parsed.get("terminologies", []))
-    parsed.setdefault("mindmap", parsed.get("mindmap", []))
-    parsed.setdefault("flashcards", parsed.get("flashcards", []))
-    parsed.setdefault("quiz", parsed.get("quiz", []))
+    parsed.setdefault("type", source_label)
+    parsed.setdefault("tags", [])
     parsed.setdefault("source", source_label)
 
     normalize_terms_and_points(parsed)
@@ -499,63 +773,217 @@ async def summarize_text_block(text: str, source_label: str = "text", title_hint
 
 
 # --- OpenAI Responses API helper (Keep) ---
-async def call_openai(messages: list, temperature: float = 0.1, max_tokens: int = MAX_OUTPUT_TOKENS) -> dict:
+# Only the fields we read are declared; msgspec skips everything else while decoding.
+class _OutputPart(msgspec.Struct):
+    type: str = ""
+    text: str = ""
+
+
+class _OutputItem(msgspec.Struct):
+    type: str = ""
+    content: Optional[List[_OutputPart]] = None
+
+
+class ResponsesResult(msgspec.Struct):
+    output: Optional[List[_OutputItem]] = None
+    output_text: Optional[str] = None
+    status: Optional[str] = None
+    incomplete_details: Optional[Dict[str, Any]] = None
+
+
+_RESPONSES_DECODER = msgspec.json.Decoder(ResponsesResult)
+
+
+def _encode_openai_body(payload: dict) -> tuple[bytes, dict]:
+    """Serialize a request payload, gzipping it when OPENAI_GZIP_REQUESTS is enabled."""
+    body = orjson.dumps(payload)
+    if not OPENAI_GZIP_REQUESTS:
+        return body, OPENAI_HEADERS
+    # Level 1: the prompt is ~25-40 KB of text, so CPU time matters more than ratio.
+    return gzip.compress(body, compresslevel=1), {**OPENAI_HEADERS, "Content-Encoding": "gzip"}
+
+
+async def call_openai(
+    messages: list,
+    temperature: float = 0.1,
+    max_tokens: int = MAX_OUTPUT_TOKENS,
+    json_only: bool = False,
+) -> ResponsesResult:
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY is not set in environment")
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
+    payload = {
+        "model": MODEL,
+        "input": messages,
+        "temperature": temperature,
+        "max_output_tokens": max_tokens,
     }
+    if json_only:
+        # Structured output mode: the reply is guaranteed to be a single JSON object.
+        payload["text"] = {"format": {"type": "json_object"}}
+    body, headers = _encode_openai_body(payload)
+    r = await HTTP_CLIENT.post(OPENAI_RESPONSES_URL, content=body, headers=headers)
+    try:
+        r.raise_for_status()
+    except httpx.HTTPStatusError:
+        raise RuntimeError(f"OpenAI API error: {r.status_code} {r.text}")
+    return _RESPONSES_DECODER.decode(r.content)
+
+async def stream_openai(
+    messages: list,
+    temperature: float = 0.1,
+    max_tokens: int = MAX_OUTPUT_TOKENS,
+) -> AsyncIterator[str]:
+    """Yield output text deltas from a streaming Responses API call as they arrive."""
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY is not set in environment")
     payload = {
         "model": MODEL,
         "input": messages,
         "temperature": temperature,
         "max_output_tokens": max_tokens,
+        "stream": True,
     }
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        r = await client.post(OPENAI_RESPONSES_URL, json=payload, headers=headers)
-        try:
-            r.raise_for_status()
-        except httpx.HTTPStatusError:
+    body, headers = _encode_openai_body(payload)
+    async with HTTP_CLIENT.stream("POST", OPENAI_RESPONSES_URL, content=body, headers=headers) as r:
+        if r.status_code >= 400:
+            await r.aread()
             raise RuntimeError(f"OpenAI API error: {r.status_code} {r.text}")
-        return r.json()
-
-def extract_text_from_responses_api(resp_json: dict) -> str:
-    if not isinstance(resp_json, dict):
-        return str(resp_json)
-    out = ""
-    for item in resp_json.get("output", []):
-        if isinstance(item, dict) and item.get("type") == "message":
-            for c in item.get("content", []):
-                if c.get("type") == "output_text":
-                    out += c.get("text", "")
-    if out:
-        return out
-    if "output_text" in resp_json:
-        return resp_json["output_text"]
-    return json.dumps(resp_json)
+        async for line in r.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if not data or data == "[DONE]":
+                continue
+            event = orjson.loads(data)
+            event_type = event.get("type")
+            if event_type == "response.output_text.delta":
+                delta = event.get("delta")
+                if delta:
+                    yield delta
+            elif event_type in ("error", "response.failed"):
+                raise RuntimeError(f"OpenAI stream error: {data}")
+
+
+def extract_text_from_responses_api(resp: ResponsesResult) -> str:
+    parts = [
+        c.text
+        for item in resp.output or ()
+        if item.type == "message"
+        for c in item.content or ()
+        if c.type == "output_text" and c.text
+    ]
+    if parts:
+        # Usual shape is a single message with a single output_text part.
+        return parts[0] if len(parts) == 1 else "".join(parts)
+    # No text (refusal, or an incomplete reply): return "" rather than the response wrapper,
+    # which callers would otherwise parse as model output.
+    return resp.output_text or ""
+
+# --- YouTube analysis pipeline ---
+class AnalysisError(Exception):
+    """A failed analysis step, carrying the HTTP status and error payload to return."""
+
+    def __init__(self, status_code: int, content: Dict[str, Any]):
+        super().__init__(content.get("detail") or content.get("error"))
+        self.status_code = status_code
+        self.content = content
+
+
+YOUTUBE_TRANSCRIPT_LANGUAGES = ["vi", "en", "en-US", "en-GB"]
+
+
+async def get_or_compute_analysis(vid: str) -> dict:
+    """Return a private copy of the parsed analysis for a video, served from cache when possible."""
+    languages = YOUTUBE_TRANSCRIPT_LANGUAGES
+    # Keyed only on what is known before any fetch, so a hit does no network I/O.
+    key = (vid, tuple(languages), MODEL, PROMPT_VERSION)
+    analysis = await cached_call(ANALYSIS_CACHE, key, lambda: _fetch_and_analyze(vid, languages))
+    # Callers only set top-level keys (source_input), so a shallow copy keeps the cached dict pristine.
+    return {**analysis}
+
+
+async def _fetch_and_analyze(vid: str, languages: List[str]) -> dict:
+    # Metadata and transcript are independent; fetch them concurrently.
+    meta, transcript_entries = await asyncio.gather(
+        fetch_video_metadata(vid),
+        fetch_transcript(vid, languages=languages),
+        return_exceptions=True,
+    )
+    if isinstance(meta, Exception):
+        raise AnalysisError(500, {"error": "metadata_fetch_failed", "detail": str(meta)})
+    if isinstance(transcript_entries, Exception):
+        raise AnalysisError(500, {"error": "transcript_error", "detail": str(transcript_entries)})
+
+    snippet = build_transcript_snippet(transcript_entries, 20000)
+    language_hint = detect_language_hint(snippet)
+    return await compute_analysis(vid, meta, snippet, language_hint)
+
+
+async def compute_analysis(vid: str, meta: Dict[str, Any], snippet: str, language_hint: str) -> dict:
+    user_payload = YOUTUBE_USER_TEMPLATE.format(
+        language_hint=language_hint,
+        title=meta.get("title"),
+        channel=meta.get("channel"),
+        snippet=snippet,
+    )
+
+    try:
+        resp = await call_openai(
+            [YOUTUBE_SYSTEM_MESSAGE, {"role": "user", "content": user_payload}],
+            temperature=0.15,
+            max_tokens=MAX_OUTPUT_TOKENS,
+            json_only=True,
+        )
+    except Exception as e:
+        raise AnalysisError(500, {"error": "openai_call_failed", "detail": str(e)})
+
+    model_text = extract_text_from_responses_api(resp)
+    if not model_text:
+        raise AnalysisError(
+            500,
+            {"error": "no_json_in_model_response", "status": resp.status, "incomplete_details": resp.incomplete_details},
+        )
+
+    try:
+        parsed = orjson.loads(model_text)
+    except Exception as e:
+        raise AnalysisError(500, {"error": "model_json_parse_failed", "detail": str(e), "model_text": model_text[:4000]})
+    if not isinstance(parsed, dict):
+        raise AnalysisError(500, {"error": "no_json_in_model_response", "model_text": model_text[:4000]})
+
+    parsed.setdefault("title", meta.get("title"))
+    parsed.setdefault("channel", meta.get("channel"))
+    parsed.setdefault("overview", "")
+    parsed.setdefault("type", "other")
+    parsed.setdefault("tags", [])
+    parsed.setdefault("source", "youtube")
+    parsed.setdefault("video_id", vid)
+
+    normalize_terms_and_points(parsed)
+    return parsed
+
 
 # --- /api/analyze endpoint (Finalized Source Handling) ---
-@app.post("/api/analyze")
-async def analyze(req: AnalyzeRequest):
+async def _analyze_single(req: AnalyzeRequest) -> Dict[str, Any]:
+    """Analyze one request; failures raise AnalysisError with the HTTP status and payload."""
     source = (req.source or "youtube").lower()
 
     if source in ("text", "long_text", "raw_text", "web"):
         if source == "web":
             if not req.url:
-                return JSONResponse(status_code=400, content={"error": "missing_url", "detail": "URL is required for webpage summarization."})
+                raise AnalysisError(400, {"error": "missing_url", "detail": "URL is required for webpage summarization."})
             try:
                 page_text = await fetch_webpage_text(req.url)
             except Exception as e:
-                return JSONResponse(status_code=500, content={"error": "web_fetch_failed", "detail": str(e)})
+                raise AnalysisError(500, {"error": "web_fetch_failed", "detail": str(e)})
 
             if not page_text:
-                return JSONResponse(status_code=400, content={"error": "empty_page", "detail": "Could not extract readable text from the page."})
+                raise AnalysisError(400, {"error": "empty_page", "detail": "Could not extract readable text from the page."})
 
             try:
                 parsed = await summarize_text_block(page_text, source_label="web", title_hint=req.url)
             except Exception as e:
-                return JSONResponse(status_code=500, content={"error": "web_summarize_failed", "detail": str(e)})
+                raise AnalysisError(500, {"error": "web_summarize_failed", "detail": str(e)})
 
             parsed.setdefault("source", "web")
             parsed.setdefault("source_url", req.url)
@@ -565,11 +993,11 @@ async def analyze(req: AnalyzeRequest):
         else: # source is text
             text_input = req.text or req.url
             if not text_input:
-                return JSONResponse(status_code=400, content={"error": "missing_text", "detail": "Text content is required for long text mode."})
+                raise AnalysisError(400, {"error": "missing_text", "detail": "Text content is required for long text mode."})
             try:
                 parsed = await summarize_text_block(text_input, source_label="text")
             except Exception as e:
-                return JSONResponse(status_code=500, content={"error": "text_summarize_failed", "detail": str(e)})
+                raise AnalysisError(500, {"error": "text_summarize_failed", "detail": str(e)})
             parsed.setdefault("source", "text")
             parsed.setdefault("source_input", text_input)
             return parsed
@@ -577,110 +1005,71 @@ async def analyze(req: AnalyzeRequest):
     # --- YouTube Summarization Logic ---
     if source == "youtube":
         if not req.url:
-            return JSONResponse(status_code=400, content={"error": "missing_url", "detail": "YouTube URL is required for this mode."})
+            raise AnalysisError(400, {"error": "missing_url", "detail": "YouTube URL is required for this mode."})
 
         try:
             vid = extract_video_id(req.url)
         except Exception as e:
-            return JSONResponse(status_code=400, content={"error": "invalid_url", "detail": str(e)})
+            raise AnalysisError(400, {"error": "invalid_url", "detail": str(e)})
 
-        try:
-            meta = await fetch_video_metadata(vid)
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": "metadata_fetch_failed", "detail": str(e)})
-
-        try:
-            transcript_entries = await fetch_transcript(vid, languages=["vi", "en", "en-US", "en-GB"])
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": "transcript_error", "detail": str(e)})
-
-        full_text = "\n".join([f"[{format_timestamp(e.get('start', 0))}]{e.get('text','')}" for e in transcript_entries])
-        snippet = full_text[:20000]
-        language_hint = detect_language_hint(full_text)
-
-        # System Prompt for YouTube: Enforcing all features
-        system_prompt = (
-            "You are a careful YouTube transcript analyzer. Return JSON ONLY (no markdown, no extra text). "
-            "Output must be a single valid JSON object that strictly follows this schema keys: "
-            "type, title, channel, overview, tags, chapters, major_points, terminologies, mindmap, flashcards, quiz. "
-            "Mindmap must be pure JSON, rooted in a central theme with 4-6 branches, each branch having a summary and 3-4 children using the {title, summary, children} format. "
-            "Flashcards must be 6-12 items. Quiz must be 5-10 MCQs with 4 choices each. "
-            ""
-            "Core Content requirements (MUST BE FOLLOWED STRICTLY): "
-            "- title: MUST be a new, concise, and engaging title (Summary Title). "
-            "- overview: MUST be 2-3 robust paragraphs (Core Message). "
-            "- major_points: MUST contain 3-5 high-impact, actionable insights (Key Takeaways). "
-            "- chapters: MUST contain 8-14 items, chronological, each with a required timestamp, sharp title, and a 1-2 sentence factual summary (Detailed Topic Breakdown). **The summary text for each chapter MUST explicitly begin with a reference to its timestamp.** "
-            "- terminologies: MUST contain 3-7 important vocabulary or core concepts with concise definitions (Key Terms & Concepts). "
-            "- tags: MUST contain 6-12 short tags (no hashtags), derived from transcript terms. "
-            "Return strictly JSON."
-        )
+        analysis = await get_or_compute_analysis(vid)
+        analysis["source_input"] = req.url
+        return analysis
+    
+    # Catch any unsupported sources (file uploads)
+    raise AnalysisError(
+        400,
+        {"error": "unsupported_source", "detail": f"Processing for {source} is not supported. Only youtube, web, and text modes are available."},
+    )
 
 
-        user_payload = (
-            f"LANGUAGE_HINT: {language_hint}\n"
-            f"METADATA:\ntitle: {meta.get('title')}\nchannel: {meta.get('channel')}\n\n"
-            f"TRANSCRIPT_SNIPPET:\n{snippet}\n\n"
-            "TASK:\n"
-            "- Classify the video type: educational, song, or other (store in `type`).\n"
-            "- Apply the strict constraints from the SYSTEM PROMPT.\n"
-            "- Respond entirely in Vietnamese when LANGUAGE_HINT is Vietnamese; otherwise respond in English.\n"
-            "- Return strictly JSON."
-        )
+@app.post("/api/analyze", response_class=ORJSONResponse)
+async def analyze(req: AnalyzeRequest):
+    try:
+        return ORJSONResponse(await _analyze_single(req))
+    except AnalysisError as e:
+        return ORJSONResponse(status_code=e.status_code, content=e.content)
 
-        try:
-            resp = await call_openai(
-                [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_payload}],
-                temperature=0.15,
-                max_tokens=MAX_OUTPUT_TOKENS,
-            )
-        except Exception as e:
-            return JSONResponse(status_code=500, content={"error": "openai_call_failed", "detail": str(e)})
 
-        model_text = extract_text_from_responses_api(resp)
+MAX_BATCH_ITEMS = 32
+BATCH_CONCURRENCY = 8
 
-        parsed = None
-        try:
-            parsed = json.loads(model_text)
-        except Exception:
-            m = re.search(r"\{[\s\S]*\}\s*$", model_text)
-            if m:
-                candidate = m.group(0)
-                try:
-                    parsed = json.loads(candidate)
-                except Exception as e:
-                    return JSONResponse(status_code=500, content={"error": "model_json_parse_failed", "detail": str(e), "model_text": model_text[:4000]})
-            else:
-                return JSONResponse(status_code=500, content={"error": "no_json_in_model_response", "model_text": model_text[:4000]})
-
-        parsed.setdefault("title", meta.get("title"))
-        parsed.setdefault("channel", meta.get("channel"))
-        parsed.setdefault("overview", parsed.get("overview", ""))
-        parsed.setdefault("type", parsed.get("type", "other"))
-        parsed.setdefault("tags", parsed.get("tags", []))
-        parsed.setdefault("major_points", parsed.get("major_points", []))
-        parsed.setdefault("chapters", parsed.get("chapters", []))
-        parsed.setdefault("terminologies", parsed.get("terminologies", []))
-        parsed.setdefault("mindmap", parsed.get("mindmap", []))
-        parsed.setdefault("flashcards", parsed.get("flashcards", []))
-        parsed.setdefault("quiz", parsed.get("quiz", []))
-        
-        parsed.setdefault("source", "youtube")
-        parsed.setdefault("video_id", vid)
-        parsed.setdefault("source_input", req.url)
 
-        normalize_terms_and_points(parsed)
+@app.post("/api/analyze/batch", response_class=ORJSONResponse)
+async def analyze_batch(req: AnalyzeBatchRequest):
+    if not req.items:
+        return ORJSONResponse(status_code=400, content={"error": "missing_items", "detail": "At least one item is required."})
+    if len(req.items) > MAX_BATCH_ITEMS:
+        return ORJSONResponse(
+            status_code=400,
+            content={"error": "too_many_items", "detail": f"A batch may contain at most {MAX_BATCH_ITEMS} items."},
+        )
 
-        return parsed
-    
-    # Catch any unsupported sources (file uploads)
-    return JSONResponse(
-        status_code=400,
-        content={"error": "unsupported_source", "detail": f"Processing for {source} is not supported. Only youtube, web, and text modes are available."},
-    )
+    # Bound concurrent OpenAI calls per batch to stay clear of rate limits.
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def _one(item: AnalyzeRequest):
+        async with sem:
+            return await _analyze_single(item)
+
+    outcomes = await asyncio.gather(*(_one(item) for item in req.items), return_exceptions=True)
+
+    # One entry per item, in request order, shaped like the single-item response;
+    # a failed item does not fail the batch.
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, AnalysisError):
+            results.append({"status_code": outcome.status_code, "body": outcome.content})
+        elif isinstance(outcome, BaseException):
+            if not isinstance(outcome, Exception):
+                raise outcome
+            results.append({"status_code": 500, "body": {"error": "internal_error", "detail": str(outcome)}})
+        else:
+            results.append({"status_code": 200, "body": outcome})
+    return ORJSONResponse({"results": results})
 
 # --- /api/chat endpoint (Restored) ---
-@app.post("/api/chat")
+@app.post("/api/chat", response_class=ORJSONResponse)
 async def chat(req: ChatRequest):
     context = req.context or {}
 
@@ -697,14 +1086,7 @@ async def chat(req: ChatRequest):
         )
 
     messages = [
-        {
-            "role": "system",
-            "content": (
-                "You are a helpful assistant. "
-                "Answer ONLY using the provided context. "
-                "Use timestamps when relevant."
-            ),
-        },
+        CHAT_SYSTEM_MESSAGE,
         {"role": "system", "content": context_text},
     ]
 
@@ -713,6 +1095,18 @@ async def chat(req: ChatRequest):
             {"role": h.get("role"), "content": h.get("content")}
         )
 
+    if req.stream:
+        deltas = stream_openai(messages, temperature=0.2, max_tokens=800)
+        # Pull the first delta before committing to a 200 so connection/auth errors still return JSON.
+        try:
+            first = await anext(deltas, "")
+        except Exception as e:
+            return ORJSONResponse(
+                status_code=500,
+                content={"error": "openai_chat_failed", "detail": str(e)},
+            )
+        return StreamingResponse(_chat_sse_events(first, deltas), media_type="text/event-stream")
+
     try:
         resp = await call_openai(
             messages,
@@ -720,10 +1114,29 @@ async def chat(req: ChatRequest):
             max_tokens=800,
         )
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={"error": "openai_chat_failed", "detail": str(e)},
         )
 
     answer = extract_text_from_responses_api(resp)
-    return {"answer": answer}
+    if not answer:
+        return ORJSONResponse(
+            status_code=500,
+            content={"error": "openai_chat_failed", "detail": f"OpenAI returned no output text (status: {resp.status})."},
+        )
+    return ORJSONResponse({"answer": answer})
+
+
+async def _chat_sse_events(first: str, deltas: AsyncIterator[str]):
+    """Frame chat deltas as server-sent events, ending with a `done` (or `error`) event."""
+    try:
+        if first:
+            yield b"data: " + orjson.dumps({"delta": first}) + b"\n\n"
+        async for delta in deltas:
+            yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+    except Exception as e:
+        payload = orjson.dumps({"error": "openai_chat_failed", "detail": str(e)})
+        yield b"event: error\ndata: " + payload + b"\n\n"
+        return
+    yield b"event: done\ndata: {}\n\n"
@@ -39,7 +39,7 @@ function start_services() {
     # run uvicorn in background, write PID
     # ensure we are in backend folder
     cd "$ROOT/backend"
-    nohup uvicorn main:app --host 0.0.0.0 --port 8000 > "$BACKEND_LOG" 2>&1 &
+    nohup uvicorn main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools > "$BACKEND_LOG" 2>&1 &
     BACKEND_PID=$!
     echo $BACKEND_PID > "$PIDFILE_BACKEND"
     echo "Backend PID: $BACKEND_PID (logs: $BACKEND_LOG)"